@@ -2,4 +2,8 @@ from .activity import ActivityViewer, PointLayerSelector
 from .colormaps import cm_inferno_alpha, cm_seismic_alpha
 from .pairwise import PointLayerPairwise
 from .viewer import NapariBrainViewer
-from .selection import enable_selection
\ No newline at end of file
+from .selection import enable_selection
+from .storage import CompactArray, NeuronMajorActivity
+from .scheduling import CallbackScheduler
+from .correlation import HyperstackCorrelation
+from .regions import RegionAggregator
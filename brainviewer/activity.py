@@ -5,6 +5,9 @@ from matplotlib.backends.backend_qt5agg import FigureCanvas
 from matplotlib.figure import Figure
 from napari.utils.notifications import show_error, show_info, show_warning
 
+from .scheduling import CallbackScheduler
+from .storage import compact
+
 
 class ActivityViewer:
     def __init__(self, brain_viewer, slider_link=False):
@@ -21,12 +24,13 @@ class ActivityViewer:
 
         if slider_link:  # if we want to draw a vertical bar at current time frame
             t_line = self.ax.axvline(0)
+            self._slider_scheduler = CallbackScheduler(delay=30, mode="throttle")
 
             @self.v.dims.events.current_step.connect
             def time_slider(e):
                 t = self.v.dims.current_step[0]
                 t_line.set_xdata([t])
-                t_line.figure.canvas.draw()
+                self._slider_scheduler.schedule(t_line.figure.canvas.draw)
 
     def update(self):
         self.ax.figure.canvas.draw()
@@ -53,17 +57,12 @@ class ActivityViewer:
 
 
 class PointLayerSelector:
-    def __init__(self, layer, widget, activities, labels=None):
+    def __init__(self, layer, widget, activities, labels=None, compact_dtype=None):
         self.layer = layer
         assert isinstance(layer, napari.layers.points.points.Points)
         self.widget = widget
 
-        if isinstance(activities, list):
-            self.activities = activities
-        elif isinstance(activities, np.ndarray):
-            self.activities = [activities]
-        else:
-            raise TypeError()
+        self.activities = _activity_list(activities, compact_dtype)
 
         if labels is None:
             self.labels = None
@@ -75,6 +74,9 @@ class PointLayerSelector:
         for a in self.activities:
             assert len(self.layer.data) == a.shape[1]
 
+        # trace reads can be slow for on-disk activities
+        self._scheduler = CallbackScheduler(delay=0)
+
         # prepare lines for the plot
         self.lines = []
         for a in self.activities:
@@ -90,15 +92,20 @@ class PointLayerSelector:
             dists = np.sum((layer.data - pos) ** 2, axis=1)
             i = np.argmin(dists)
             change_point_colors(l, i)
-            for j in range(len(self.activities)):
-                self.lines[j].set_ydata(self.activities[j][:, i])
-            self.widget.rescale_y()
+            self._scheduler.schedule(
+                lambda cancel: [a[:, i] for a in self.activities], self._show_traces
+            )
 
         show_info("Right Click on a neuron to display its activity.")
 
+    def _show_traces(self, traces):
+        for line, trace in zip(self.lines, traces):
+            line.set_ydata(trace)
+        self.widget.rescale_y()
+
 
 class ContourLayerSelector:
-    def __init__(self, layer, widget, activities, labels=None):
+    def __init__(self, layer, widget, activities, labels=None, compact_dtype=None):
         self.layer = layer
         assert isinstance(layer, napari.layers.shapes.shapes.Shapes)
         assert hasattr(layer, "ids")
@@ -113,12 +120,7 @@ class ContourLayerSelector:
             COMS.append(com)
         self.COMs = np.array(COMS)
 
-        if isinstance(activities, list):
-            self.activities = activities
-        elif isinstance(activities, np.ndarray):
-            self.activities = [activities]
-        else:
-            raise TypeError()
+        self.activities = _activity_list(activities, compact_dtype)
 
         if labels is None:
             self.labels = None
@@ -130,6 +132,9 @@ class ContourLayerSelector:
         for a in self.activities:
             assert len(np.unique(self.layer.ids)) == a.shape[1]
 
+        # trace reads can be slow for on-disk activities
+        self._scheduler = CallbackScheduler(delay=0)
+
         # prepare lines for the plot
         self.lines = []
         for a in self.activities:
@@ -145,12 +150,28 @@ class ContourLayerSelector:
             dists = np.sum((self.COMs - pos) ** 2, axis=1)
             i = np.argmin(dists)
             change_shape_colors(l, i)
-            for j in range(len(self.activities)):
-                self.lines[j].set_ydata(self.activities[j][:, i])
-            self.widget.rescale_y()
+            self._scheduler.schedule(
+                lambda cancel: [a[:, i] for a in self.activities], self._show_traces
+            )
 
         show_info("Right Click on a neuron to display its activity.")
 
+    def _show_traces(self, traces):
+        for line, trace in zip(self.lines, traces):
+            line.set_ydata(trace)
+        self.widget.rescale_y()
+
+
+def _activity_list(activities, compact_dtype=None):
+    if not isinstance(activities, list):
+        activities = [activities]
+    for a in activities:
+        # numpy arrays, h5py/zarr datasets or wrappers of those
+        if not (hasattr(a, "shape") and hasattr(a, "__getitem__")):
+            raise TypeError()
+        assert len(a.shape) == 2
+    return [compact(a, compact_dtype) for a in activities]
+
 
 def change_point_colors(layer, i):
     colors = np.ones((layer.data.shape[0], 4))
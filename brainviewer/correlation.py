@@ -0,0 +1,223 @@
+from pathlib import Path
+
+import napari
+import numpy as np
+from napari.utils.notifications import show_info
+
+from .colormaps import cm_seismic_alpha
+from .scheduling import CallbackScheduler
+
+
+def _frames_per_block(hstack, chunk_size, max_memory):
+    # number of frames of a single plane read at once, as float64
+    if chunk_size is not None:
+        return chunk_size
+    nx, ny = hstack.shape[2:]
+    return max(1, int(max_memory // (nx * ny * 8)))
+
+
+def voxel_moments(
+    hstack, chunk_size=None, cache_path=None, max_memory=256 * 2**20, cancel=None
+):
+    """Per-voxel mean and standard deviation of a (z, t, x, y) hyperstack.
+
+    Parameters
+    ==========
+    hstack : array-like
+        hyperstack, can be a numpy, zarr or h5py array.
+    chunk_size : int
+        number of time frames of a plane read at once, derived from
+        `max_memory` if None.
+    max_memory : int
+        maximum number of bytes of a block read at once.
+    cache_path : str or Path
+        .npz file where the moments are saved, and loaded from if it exists.
+    cancel : threading.Event
+        stops the computation when set.
+
+    Return
+    ======
+    mean, std : np.ndarray
+        (z, x, y) arrays, None if cancelled.
+    """
+    if cache_path is not None and Path(cache_path).exists():
+        cache = np.load(cache_path)
+        return cache["mean"], cache["std"]
+
+    nz, nt, nx, ny = hstack.shape
+    chunk_size = _frames_per_block(hstack, chunk_size, max_memory)
+    s1 = np.zeros((nz, nx, ny))
+    s2 = np.zeros((nz, nx, ny))
+    for z in range(nz):
+        for t in range(0, nt, chunk_size):
+            if cancel is not None and cancel.is_set():
+                return None
+            block = np.asarray(hstack[z, t : t + chunk_size], dtype=float)
+            s1[z] += block.sum(axis=0)
+            s2[z] += np.einsum("txy,txy->xy", block, block)
+    mean = s1 / nt
+    std = np.sqrt(np.maximum(s2 / nt - mean**2, 0))
+
+    if cache_path is not None:
+        np.savez(cache_path, mean=mean, std=std)
+    return mean, std
+
+
+def seed_correlation(
+    hstack,
+    seed,
+    moments,
+    planes=None,
+    chunk_size=None,
+    max_memory=256 * 2**20,
+    cancel=None,
+):
+    """Correlation of a seed voxel with every voxel of some planes.
+
+    The hyperstack is streamed in time chunks, accumulating the products of
+    the seed trace with every voxel in a single pass.
+
+    Parameters
+    ==========
+    hstack : array-like
+        (z, t, x, y) hyperstack.
+    seed : tuple of int
+        (z, x, y) position of the seed voxel.
+    moments : tuple of np.ndarray
+        per-voxel (mean, std), as returned by `voxel_moments`.
+    planes : list of int
+        z planes on which the correlation is computed, all planes if None.
+    chunk_size : int
+        number of time frames of a plane read at once, derived from
+        `max_memory` if None.
+    max_memory : int
+        maximum number of bytes of a block read at once.
+    cancel : threading.Event
+        stops the computation when set.
+
+    Return
+    ======
+    corr : np.ndarray
+        (len(planes), x, y) correlation map, None if cancelled.
+    """
+    nz, nt, nx, ny = hstack.shape
+    if planes is None:
+        planes = list(range(nz))
+    z, x, y = seed
+    mean, std = moments
+
+    chunk_size = _frames_per_block(hstack, chunk_size, max_memory)
+    acc = np.zeros((len(planes), nx, ny))
+    for t in range(0, nt, chunk_size):
+        if cancel is not None and cancel.is_set():
+            return None
+        seed_trace = np.asarray(hstack[z, t : t + chunk_size, x, y], dtype=float)
+        # one plane at a time to bound memory
+        for k, p in enumerate(planes):
+            block = np.asarray(hstack[p, t : t + chunk_size], dtype=float)
+            acc[k] += np.tensordot(seed_trace, block, axes=(0, 0))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = acc / nt - mean[z, x, y] * mean[planes]
+        corr = cov / (std[z, x, y] * std[planes])
+    corr[~np.isfinite(corr)] = 0
+    return corr
+
+
+class HyperstackCorrelation:
+    """Seed-based correlation maps on a hyperstack image layer.
+
+    Right-clicking a voxel shows its correlation with every voxel of the
+    current plane (mode="plane") or of the whole volume (mode="volume") as an
+    image overlay.
+    """
+
+    def __init__(
+        self,
+        brain_viewer,
+        layer,
+        mode="plane",
+        cmap=cm_seismic_alpha,
+        crange=(-1, 1),
+        chunk_size=None,
+        cache_path=None,
+    ):
+        self.nbv = brain_viewer
+        self.layer = layer
+        assert isinstance(layer, napari.layers.image.image.Image)
+        assert layer.data.ndim == 4
+        assert mode in ("plane", "volume")
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.cache_path = cache_path
+        self._moments = None
+        self._scheduler = CallbackScheduler(delay=0)
+
+        # overlay spanning the whole time axis with a single frame: a pixel is
+        # centered on its coordinate, the frame is moved to the middle of the
+        # recording so that it covers the frames 0 to nt - 1
+        nz, nt, nx, ny = layer.data.shape
+        scale = np.array(layer.scale, dtype=float)
+        translate = np.array(layer.translate, dtype=float)
+        translate[1] += (nt - 1) / 2 * scale[1]
+        scale[1] *= nt
+        self.overlay = self.nbv.viewer.add_image(
+            np.full((nz, 1, nx, ny), np.nan, dtype=np.float32),
+            colormap=cmap,
+            contrast_limits=crange,
+            scale=scale,
+            translate=translate,
+            blending="translucent",
+            name=f"Correlation: {layer.name}",
+        )
+        # mouse callbacks are only sent to the active layer
+        self.nbv.viewer.layers.selection.active = layer
+
+        @self.layer.mouse_drag_callbacks.append
+        def click_finder(l, e):
+            if e.button != 2:
+                return
+            pos = np.round(l.world_to_data(e.position)).astype(int)
+            pos = np.clip(pos, 0, np.array(l.data.shape) - 1)
+            z, _, x, y = pos
+            planes = [z] if self.mode == "plane" else None
+            self._scheduler.schedule(
+                lambda cancel: self._correlation((z, x, y), planes, cancel),
+                lambda result: self._show(*result),
+            )
+
+        show_info("Right Click on a voxel to display its correlation map.")
+
+    @property
+    def moments(self):
+        if self._moments is None:
+            self._moments = voxel_moments(
+                self.layer.data, self.chunk_size, self.cache_path
+            )
+        return self._moments
+
+    def _correlation(self, seed, planes, cancel=None):
+        if self._moments is None:
+            # the moments are only kept once fully computed
+            self._moments = voxel_moments(
+                self.layer.data, self.chunk_size, self.cache_path, cancel=cancel
+            )
+            if self._moments is None:
+                return None
+        corr = seed_correlation(
+            self.layer.data,
+            seed,
+            self._moments,
+            planes,
+            self.chunk_size,
+            cancel=cancel,
+        )
+        return corr, planes
+
+    def _show(self, corr, planes):
+        data = np.full(self.overlay.data.shape, np.nan, dtype=np.float32)
+        if planes is None:
+            data[:, 0] = corr
+        else:
+            data[planes, 0] = corr
+        self.overlay.data = data
@@ -0,0 +1,191 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import napari
+import numpy as np
+
+from .colormaps import map_color
+
+VIDEO_SUFFIXES = (".mp4", ".avi", ".mov", ".mkv", ".gif")
+# written by imageio through ffmpeg, which is not part of the base environment
+FFMPEG_SUFFIXES = (".mp4", ".avi", ".mov", ".mkv")
+
+
+def frame_colors(layer, activity, cmap, crange, t):
+    """Face colors of a points or contours layer at time frame t.
+
+    Parameters
+    ==========
+    layer : napari.layers.Points or napari.layers.Shapes
+        layer to color, contours need the `ids` attribute set by
+        `NapariBrainViewer.contours`.
+    activity : array-like
+        (time, neurons) activity.
+    cmap : napari.utils.Colormap
+        colormap used to map activities to colors.
+    crange : tuple
+        contrast limits of the activity.
+    t : int
+        time frame.
+    """
+    values = np.asarray(activity[t], dtype=float)
+    if isinstance(layer, napari.layers.shapes.shapes.Shapes):
+        values = values[layer.ids]
+    return map_color(cmap, values, crange)
+
+
+def interpolate_camera(keyframes, n_frames):
+    """Linear interpolation of camera states.
+
+    Parameters
+    ==========
+    keyframes : list of dict
+        camera states, e.g. {"center": (z, x, y), "zoom": 2, "angles": (0, 0, 90)},
+        evenly spread over the frames.
+    n_frames : int
+        number of frames of the movie.
+
+    Return
+    ======
+    states : list of dict
+        one camera state per frame.
+    """
+    if len(keyframes) == 1:
+        return [dict(keyframes[0]) for _ in range(n_frames)]
+    x_keys = np.linspace(0, 1, len(keyframes))
+    x = np.linspace(0, 1, n_frames)
+    states = [{} for _ in range(n_frames)]
+    for key in keyframes[0]:
+        values = np.array([np.atleast_1d(k[key]) for k in keyframes], dtype=float)
+        interp = np.stack(
+            [np.interp(x, x_keys, values[:, j]) for j in range(values.shape[1])],
+            axis=1,
+        )
+        for state, v in zip(states, interp):
+            state[key] = tuple(v) if len(v) > 1 else v[0]
+    return states
+
+
+class _FrameWriter:
+    def __init__(self, path, fps):
+        self.path = Path(path)
+        self.n = 0
+        suffix = self.path.suffix.lower()
+        if suffix in FFMPEG_SUFFIXES:
+            try:
+                import imageio_ffmpeg  # noqa: F401
+            except ImportError:
+                raise ImportError(
+                    f"writing {suffix} videos requires imageio-ffmpeg "
+                    "(pip install imageio-ffmpeg), use a .gif file or a directory "
+                    "of .png images otherwise"
+                ) from None
+        if suffix in VIDEO_SUFFIXES:
+            import imageio.v2 as imageio
+
+            self._writer = imageio.get_writer(self.path, fps=fps)
+        else:
+            # image sequence in a directory
+            self._writer = None
+            self.path.mkdir(parents=True, exist_ok=True)
+
+    def write(self, frame):
+        if self._writer is not None:
+            self._writer.append_data(frame[..., :3])
+        else:
+            import imageio.v2 as imageio
+
+            imageio.imwrite(self.path / f"frame_{self.n:05d}.png", frame)
+        self.n += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def render_movie(
+    viewer,
+    path,
+    frames,
+    activities=None,
+    camera_path=None,
+    time_axis=None,
+    fps=10,
+    max_workers=4,
+):
+    """Render a range of time frames of a napari viewer to a movie.
+
+    The colors of the animated layers are computed ahead of time in a thread
+    pool while the previous frames are rendered, and frames are streamed to the
+    encoder, so that memory does not grow with the movie length.
+
+    Parameters
+    ==========
+    viewer : napari.Viewer
+        viewer to render, can be hidden.
+    path : str or Path
+        .gif file, or directory where a .png image sequence is written.
+        .mp4, .avi, .mov and .mkv videos need the imageio-ffmpeg package.
+    frames : iterable of int
+        time frames to render.
+    activities : dict
+        {layer: (activity, cmap, crange)} points or contours layers colored by
+        a (time, neurons) activity at each frame.
+    camera_path : list of dict
+        camera keyframes, see `interpolate_camera`.
+    time_axis : int
+        dimension of the viewer slider stepped at each frame, defaults to the
+        "t" axis if any. Without time axis the sliders are left unchanged,
+        e.g. to only animate the activities or the camera.
+    fps : int
+        frames per second of the video.
+    max_workers : int
+        number of threads computing the frame colors.
+
+    Return
+    ======
+    n : int
+        number of frames written.
+    """
+    frames = list(frames)
+    activities = {} if activities is None else activities
+    if time_axis is None:
+        labels = list(viewer.dims.axis_labels)
+        time_axis = labels.index("t") if "t" in labels else None
+    cameras = None
+    if camera_path is not None:
+        cameras = interpolate_camera(camera_path, len(frames))
+
+    def colors(t):
+        return {
+            layer: frame_colors(layer, activity, cmap, crange, t)
+            for layer, (activity, cmap, crange) in activities.items()
+        }
+
+    writer = _FrameWriter(path, fps)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # bounded look-ahead of frame colors
+            pending = deque()
+            upcoming = iter(frames)
+            for t in upcoming:
+                pending.append(pool.submit(colors, t))
+                if len(pending) >= 2 * max_workers:
+                    break
+            for i, t in enumerate(frames):
+                layer_colors = pending.popleft().result()
+                next_t = next(upcoming, None)
+                if next_t is not None:
+                    pending.append(pool.submit(colors, next_t))
+
+                if time_axis is not None:
+                    viewer.dims.set_current_step(time_axis, t)
+                for layer, c in layer_colors.items():
+                    layer.face_color = c
+                if cameras is not None:
+                    viewer.camera.update(cameras[i])
+                writer.write(viewer.screenshot(canvas_only=True, flash=False))
+    finally:
+        writer.close()
+    return writer.n
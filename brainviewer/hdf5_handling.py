@@ -1,7 +1,11 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import h5py
+import numpy as np
 from magicgui.widgets import FileEdit
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_error, show_info
 from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt
 from qtpy.QtCore import QUrl
@@ -10,6 +14,216 @@ from qtpy.QtWidgets import (QAbstractItemView, QFileDialog, QHBoxLayout,
                             QVBoxLayout, QWidget)
 
 
+# statistics already computed, by (file path, modification time, dataset path)
+_STATS_CACHE = {}
+# statistics being computed, by the same keys, set when the computation ends
+_STATS_RUNNING = {}
+_STATS_LOCK = threading.Lock()
+
+
+class DatasetStats:
+    """Summary statistics of a dataset, with a coarse histogram.
+
+    Quantiles are computed from a uniform sample of the finite values, so that
+    isolated outliers do not distort them as a histogram over [min, max] would.
+    """
+
+    def __init__(
+        self, vmin, vmax, mean, nan_count, count, sample, bins=64, inf_count=0
+    ):
+        self.min = vmin
+        self.max = vmax
+        self.mean = mean
+        self.nan_count = nan_count
+        self.inf_count = inf_count
+        self.count = count
+        self.sample = sample
+        if sample.size == 0:
+            self.hist, self.bin_edges = np.zeros(bins), np.zeros(bins + 1)
+        else:
+            hist, self.bin_edges = np.histogram(sample, bins=bins, range=(vmin, vmax))
+            self.hist = hist * (count / sample.size)
+
+    def quantile(self, q):
+        """Approximate quantiles, estimated on the sample."""
+        if self.sample.size == 0:
+            return np.full(np.shape(q), self.min)
+        return np.quantile(self.sample, q)
+
+    def __str__(self):
+        text = (
+            f"min {self.min:.4g}  max {self.max:.4g}  mean {self.mean:.4g}"
+            f"  NaN {self.nan_count}"
+        )
+        if self.inf_count:
+            text += f"  inf {self.inf_count}"
+        return text
+
+
+def has_numeric_values(dset):
+    """Whether statistics can be computed on the dataset (numeric, not scalar)."""
+    return bool(dset.shape) and dset.dtype.kind in "biuf"
+
+
+def _stats_key(dset):
+    path = Path(dset.file.filename).resolve()
+    return (str(path), path.stat().st_mtime, dset.name)
+
+
+def _dataset_blocks(dset, block_bytes=64 * 2**20):
+    if dset.chunks is not None:
+        yield from dset.iter_chunks()
+        return
+    row_bytes = max(1, dset.dtype.itemsize * int(np.prod(dset.shape[1:])))
+    step = max(1, block_bytes // row_bytes)
+    for s in range(0, dset.shape[0], step):
+        yield (slice(s, s + step),)
+
+
+def _block_stats(dset, block, step, cancel):
+    if cancel.is_set():
+        return None
+    values = np.asarray(dset[block], dtype=float).ravel()
+    # one value every `step` of the whole dataset, with a random phase per block
+    sample = values[np.random.default_rng().integers(step) :: step]
+    sample = sample[np.isfinite(sample)]
+    # min, max and mean only over finite values, infinities are counted apart
+    n_nans = np.isnan(values).sum()
+    n_infs = np.isinf(values).sum()
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return (np.inf, -np.inf, 0.0, 0, n_nans, sample, n_infs)
+    return (
+        finite.min(),
+        finite.max(),
+        finite.sum(),
+        finite.size,
+        n_nans,
+        sample,
+        n_infs,
+    )
+
+
+def dataset_stats(dset, bins=64, max_workers=4, cancel=None, n_samples=100_000):
+    """Compute statistics of a HDF5 dataset, streaming over its chunks.
+
+    If the same dataset is already being processed (e.g. by the HDF5 browser),
+    this waits for that computation instead of scanning the dataset again.
+
+    Parameters
+    ==========
+    dset : h5py.Dataset
+        dataset to summarize.
+    bins : int
+        number of bins of the histogram.
+    max_workers : int
+        number of threads reading the chunks.
+    cancel : threading.Event
+        when set, the computation stops and returns None.
+    n_samples : int
+        approximate number of values kept over the whole dataset, to estimate
+        quantiles and the histogram.
+
+    Return
+    ======
+    stats : DatasetStats or None
+        cached per file and dataset path, None if cancelled.
+    """
+    if not has_numeric_values(dset):
+        raise TypeError(f"no statistics for {dset.dtype} dataset of shape {dset.shape}")
+    key = _stats_key(dset)
+    if cancel is None:
+        cancel = threading.Event()
+    while True:
+        with _STATS_LOCK:
+            if key in _STATS_CACHE:
+                return _STATS_CACHE[key]
+            running = _STATS_RUNNING.get(key)
+            if running is None:
+                done = _STATS_RUNNING[key] = threading.Event()
+                break
+        # waiting for the running computation, it may also have been cancelled
+        running.wait()
+        if cancel.is_set():
+            return None
+
+    try:
+        stats = _compute_stats(dset, bins, max_workers, cancel, n_samples)
+        if stats is not None:
+            _STATS_CACHE[key] = stats
+        return stats
+    finally:
+        with _STATS_LOCK:
+            del _STATS_RUNNING[key]
+        done.set()
+
+
+def _compute_stats(dset, bins, max_workers, cancel, n_samples):
+    step = max(1, -(-dset.size // n_samples))
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for block in _dataset_blocks(dset):
+            if cancel.is_set():
+                break
+            pending.add(pool.submit(_block_stats, dset, block, step, cancel))
+            # bounding the number of blocks held in memory
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend(f.result() for f in done)
+        results.extend(f.result() for f in pending)
+    if cancel.is_set():
+        return None
+
+    vmin = min((r[0] for r in results), default=np.inf)
+    vmax = max((r[1] for r in results), default=-np.inf)
+    total = sum(r[2] for r in results)
+    count = sum(r[3] for r in results)
+    nan_count = int(sum(r[4] for r in results))
+    inf_count = int(sum(r[6] for r in results))
+    sample = np.concatenate([r[5] for r in results] + [np.zeros(0)])
+    if count == 0:
+        vmin = vmax = np.nan
+    mean = total / count if count else np.nan
+    return DatasetStats(
+        vmin, vmax, mean, nan_count, count, sample, bins, inf_count=inf_count
+    )
+
+
+def read_fish(path, coords, values=None, lod_levels=None, quantiles=(0.01, 0.99)):
+    """Read the datasets of one fish, used as a worker of cohort loading.
+
+    Parameters
+    ==========
+    path : str or Path
+        HDF5 file of the fish.
+    coords : str
+        path of the (n, 3) neuron coordinates dataset.
+    values : str
+        path of an optional (n,) per-neuron values dataset.
+    lod_levels : int
+        if given, level-of-detail ranks are computed with this number of levels.
+    quantiles : tuple of float
+        quantiles of the values used to build shared contrast limits.
+
+    Return
+    ======
+    fish : dict
+        with "coords", "values", "ranks" and "crange" entries.
+    """
+    from .lod import stratified_ranks
+
+    with h5py.File(path, "r") as file:
+        fish = {"coords": file[coords][()], "values": None, "crange": None}
+        if values is not None:
+            fish["values"] = file[values][()]
+            fish["crange"] = np.nanquantile(fish["values"], quantiles)
+    fish["ranks"] = None
+    if lod_levels is not None:
+        fish["ranks"] = stratified_ranks(fish["coords"], n_levels=lod_levels)
+    return fish
+
+
 class HDF5TreeItem:
     """A simple tree item to hold information about each node."""
 
@@ -139,6 +353,12 @@ class HDF5_Browser(QWidget):
         self.tree_view.setModel(self.model)
         self.layout().addWidget(self.tree_view)
         self.tree_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.tree_view.selectionModel().selectionChanged.connect(self._update_stats)
+
+        # statistics of the selected dataset
+        self._stats_label = QLabel("")
+        self.layout().addWidget(self._stats_label)
+        self._stats_cancel = threading.Event()
 
         button = QPushButton("Load as new Layer")
         button.clicked.connect(self._load_data)
@@ -163,8 +383,60 @@ class HDF5_Browser(QWidget):
             self.nbv.points(obj[()], size=4)
 
         elif action == "image":
+            if ndim > 4:
+                show_error(f"Cannot display {ndim}D datasets")
+                return
             show_info("Loading image.")
 
+            def read(obj):
+                # reuses the statistics cached or being computed for the browser
+                return dataset_stats(obj), obj[()]
+
+            worker = thread_worker(read)(obj)
+            worker.returned.connect(lambda result: self._add_image(obj.name, *result))
+            worker.errored.connect(lambda e: show_error(f"Cannot load {obj.name}: {e}"))
+            worker.start()
+
+    def _add_image(self, name, stats, data):
+        if data.ndim == 2:
+            clims = stats.quantile([0.05, 0.95])
+            self.nbv.image(data, clims=clims, name=name)
+        elif data.ndim == 3:
+            clims = stats.quantile([0.5, 0.9999])
+            self.nbv.stack(data, clims=clims, name=name)
+        else:
+            clims = stats.quantile([0.5, 0.9999])
+            self.nbv.hyperstack(data, clims=clims, name=name)
+
+    def _update_stats(self, *args):
+        # cancelling the computation of the previously selected dataset
+        self._stats_cancel.set()
+        self._stats_cancel = threading.Event()
+
+        selected = self.tree_view.selectedIndexes()
+        if len(selected) != 1:
+            return
+        item = selected[0].internalPointer()
+        if item.type != h5py.Dataset or not has_numeric_values(item.obj):
+            self._stats_label.setText("")
+            return
+
+        self._stats_label.setText("computing statistics...")
+        cancel = self._stats_cancel
+        worker = thread_worker(dataset_stats)(item.obj, cancel=cancel)
+
+        @worker.returned.connect
+        def show_stats(stats):
+            if stats is not None and not cancel.is_set():
+                self._stats_label.setText(str(stats))
+
+        @worker.errored.connect
+        def show_failure(e):
+            if not cancel.is_set():
+                self._stats_label.setText(f"no statistics: {e}")
+
+        worker.start()
+
     def _get_selected_dataset(self):
         selected = self.tree_view.selectedIndexes()
         assert len(selected) == 1
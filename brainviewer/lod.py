@@ -0,0 +1,148 @@
+import numpy as np
+
+from .scheduling import CallbackScheduler
+
+
+def stratified_ranks(coords, n_levels=8, seed=0):
+    """Rank points so that any prefix is a spatially stratified subsample.
+
+    Parameters
+    ==========
+    coords : np.ndarray
+        (n, d) point coordinates.
+    n_levels : int
+        number of grid levels, the cell size is halved at each level.
+    seed : int
+        seed of the random choice of the point representing each cell.
+
+    Return
+    ======
+    ranks : np.ndarray
+        (n,) int array, points with `ranks < k` are the k first points of a
+        coarse to fine sampling: one point per cell of the coarsest grid, then
+        one point per cell of the next grid, and so on.
+    """
+    coords = np.asarray(coords, dtype=float)
+    n = len(coords)
+    order = np.random.default_rng(seed).permutation(n)
+    mins = coords.min(axis=0)
+    extent = np.ptp(coords, axis=0).max()
+    extent = extent if extent > 0 else 1.0
+
+    picked = np.zeros(n, dtype=bool)
+    sequence = []
+    for level in range(1, n_levels + 1):
+        cell = extent / 2**level
+        cells = np.floor((coords[order] - mins) / cell).astype(np.int64)
+        # flat cell index, much faster to deduplicate than rows of cells
+        keys = np.ravel_multi_index(cells.T, (2**level + 1,) * coords.shape[1])
+        _, first = np.unique(keys, return_index=True)
+        new = order[np.sort(first)]
+        new = new[~picked[new]]
+        picked[new] = True
+        sequence.append(new)
+    sequence.append(order[~picked[order]])
+
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[np.concatenate(sequence)] = np.arange(n)
+    return ranks
+
+
+class PointLevelOfDetail:
+    """Level-of-detail display of a large points layer.
+
+    When zoomed out or in 3D, only a stratified subsample of at most
+    `max_points` points is shown. In 2D, the points of the visible region and
+    slab are filled in up to full density as the view gets smaller.
+    Points are hidden through `layer.shown`, so point indices are unchanged.
+
+    Parameters
+    ==========
+    viewer : napari.Viewer
+        viewer displaying the layer.
+    layer : napari.layers.Points
+        layer to control.
+    max_points : int
+        maximum number of points shown in the view.
+    thickness : float
+        thickness of the displayed slab in 2D, defaults to the point size.
+    n_levels : int
+        number of levels of the stratified subsampling.
+    ranks : np.ndarray
+        precomputed `stratified_ranks` of the layer data.
+    """
+
+    def __init__(
+        self,
+        viewer,
+        layer,
+        max_points=50_000,
+        thickness=None,
+        n_levels=8,
+        ranks=None,
+    ):
+        self.viewer = viewer
+        self.layer = layer
+        self.max_points = max_points
+        if thickness is None:
+            thickness = np.max(layer.size)
+        self.thickness = thickness
+
+        if ranks is None:
+            ranks = stratified_ranks(layer.data, n_levels=n_levels)
+        assert len(ranks) == len(layer.data)
+        self.ranks = ranks
+        self._world = np.asarray(layer._data_to_world(layer.data))
+
+        # camera and slider events come in bursts while zooming/panning
+        self._scheduler = CallbackScheduler(delay=50, mode="throttle")
+        viewer.camera.events.zoom.connect(self._on_view_change)
+        viewer.camera.events.center.connect(self._on_view_change)
+        viewer.dims.events.current_step.connect(self._on_view_change)
+        viewer.dims.events.ndisplay.connect(self._on_view_change)
+        self.refresh()
+
+    def _on_view_change(self, event=None):
+        self._scheduler.schedule(self.refresh)
+
+    def refresh(self, event=None):
+        if self.viewer.dims.ndisplay == 3:
+            shown = self.ranks < self.max_points
+        else:
+            # coarse background so that panning never shows an empty view
+            shown = self.ranks < self.max_points // 8
+            in_view = self._in_view()
+            view_ranks = self.ranks[in_view]
+            if view_ranks.size > self.max_points:
+                limit = np.partition(view_ranks, self.max_points - 1)[
+                    self.max_points - 1
+                ]
+                in_view &= self.ranks <= limit
+            shown |= in_view
+        self.layer.shown = shown
+
+    def _in_view(self):
+        dims = self.viewer.dims
+        offset = dims.ndim - self.layer.ndim
+        mask = np.ones(len(self._world), dtype=bool)
+
+        # slab along the non displayed dimensions
+        for d in dims.not_displayed:
+            if d < offset:
+                continue
+            coord = self._world[:, d - offset]
+            mask &= np.abs(coord - dims.point[d]) <= self.thickness / 2
+
+        # visible rectangle of the canvas
+        try:
+            size = self.viewer.window._qt_viewer.canvas.size
+        except AttributeError:
+            return mask
+        camera = self.viewer.camera
+        for d, center, pixels in zip(dims.displayed, camera.center[-2:], size):
+            if d < offset:
+                continue
+            half = pixels / 2 / camera.zoom
+            coord = self._world[:, d - offset]
+            mask &= np.abs(coord - center) <= half
+        return mask
@@ -3,6 +3,8 @@ import numpy as np
 from napari.utils.notifications import show_error, show_info, show_warning
 
 from .colormaps import map_color
+from .scheduling import CallbackScheduler
+from .storage import compact
 
 
 class PointLayerPairwise:
@@ -12,18 +14,20 @@ class PointLayerPairwise:
         pairwise,
         cmap,
         crange,
+        compact_dtype=None,
     ):
         self.layer = layer
         assert isinstance(layer, napari.layers.points.points.Points)
 
         # checking if pairwise matrix has the correct nb of elements
-        self.pairwise = pairwise
+        self.pairwise = compact(pairwise, compact_dtype)
         assert self.pairwise.shape[0] == self.pairwise.shape[1]
         assert len(self.layer.data) == self.pairwise.shape[0]
 
         # handling colors
         self.cmap = cmap
         self.crange = crange
+        self._scheduler = CallbackScheduler(delay=0)
 
         @self.layer.mouse_drag_callbacks.append
         def click_finder(l, e):
@@ -32,8 +36,9 @@ class PointLayerPairwise:
             pos = l.world_to_data(e.position)
             dists = np.sum((layer.data - pos) ** 2, axis=1)
             i = np.argmin(dists)
-            change_point_colors(
-                l, i, map_color(self.cmap, self.pairwise[i], self.crange)
+            self._scheduler.schedule(
+                lambda cancel: map_color(self.cmap, self.pairwise[i], self.crange),
+                lambda colors: change_point_colors(l, i, colors),
             )
 
         show_info("Right Click on a neuron to display Pairwise.")
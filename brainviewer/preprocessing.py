@@ -0,0 +1,195 @@
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from scipy.ndimage import percentile_filter
+
+
+def rolling_percentile_baseline(f, window, percentile=8, time_axis=0):
+    """Baseline of fluorescence traces as a rolling percentile over time.
+
+    Parameters
+    ==========
+    f : np.ndarray
+        fluorescence, with time along `time_axis`.
+    window : int
+        size of the rolling window in frames.
+    percentile : float
+        percentile of the window used as baseline.
+    time_axis : int
+        axis of the time dimension.
+
+    Return
+    ======
+    f0 : np.ndarray
+        baseline with the same shape as `f`.
+    """
+    size = [1] * f.ndim
+    size[time_axis] = window
+    return percentile_filter(f, percentile, size=size, mode="nearest")
+
+
+def delta_f_over_f(f, window, percentile=8, time_axis=0):
+    """ΔF/F of in-memory fluorescence, with a rolling percentile baseline."""
+    f = np.asarray(f, dtype=np.float32)
+    f0 = rolling_percentile_baseline(f, window, percentile, time_axis)
+    return np.divide(f - f0, f0, out=np.zeros_like(f), where=f0 != 0)
+
+
+def delta_f_over_f_to_zarr(
+    source,
+    path,
+    window,
+    percentile=8,
+    time_axis=0,
+    chunk_size=256,
+    max_workers=None,
+    max_memory=256 * 2**20,
+):
+    """Streaming ΔF/F of a recording, written to a chunked zarr array.
+
+    The recording is split in chunks of `chunk_size` frames and, since the
+    baseline is computed per voxel/neuron along time, in tiles along the other
+    axes so that each task reads at most about `max_memory` bytes. Tasks run
+    in worker processes, each with `window // 2` frames of overlap on both
+    sides, so that the result is identical to `delta_f_over_f` on the whole
+    recording. At most two tasks per worker are in flight at any time.
+
+    Parameters
+    ==========
+    source : np.ndarray, zarr.Array or h5py.Dataset
+        fluorescence, e.g. (time, neurons) activities or (z, t, x, y)
+        hyperstacks with `time_axis=1`.
+    path : str or Path
+        location of the output zarr array.
+    window : int
+        size of the rolling window in frames.
+    percentile : float
+        percentile of the window used as baseline.
+    time_axis : int
+        axis of the time dimension.
+    chunk_size : int
+        number of frames processed per task, also the zarr chunk along time.
+    max_workers : int
+        number of worker processes, defaults to the number of cores.
+    max_memory : int
+        approximate number of bytes of the float32 block read by a task, the
+        other axes are tiled accordingly and set the zarr chunks.
+
+    Return
+    ======
+    dff : zarr.Array
+        ΔF/F opened in read-only mode.
+    """
+    import zarr
+
+    shape = source.shape
+    nt = shape[time_axis]
+    halo = window // 2 + 1
+    chunks = _tile_shape(shape, time_axis, chunk_size + 2 * halo, max_memory)
+    chunks[time_axis] = chunk_size
+    zarr.open(
+        str(path),
+        mode="w",
+        shape=shape,
+        chunks=tuple(chunks),
+        dtype=np.float32,
+    )
+
+    # tasks are aligned on the zarr chunks, so workers never write the same chunk
+    tiles = [
+        [slice(s, min(s + c, n)) for s in range(0, n, c)]
+        for n, c in zip(shape, chunks)
+    ]
+    tiles[time_axis] = [slice(0, 0)]
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    # forking a process with running Qt/worker threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        n_inflight = 2 * max_workers
+        pending = set()
+        for t0 in range(0, nt, chunk_size):
+            t1 = min(t0 + chunk_size, nt)
+            start, stop = max(0, t0 - halo), min(nt, t1 + halo)
+            for tile in itertools.product(*tiles):
+                read_key = list(tile)
+                read_key[time_axis] = slice(start, stop)
+                write_key = list(tile)
+                write_key[time_axis] = slice(t0, t1)
+                read_key, write_key = tuple(read_key), tuple(write_key)
+                if isinstance(source, np.ndarray):
+                    # only the block and its overlap are sent to the worker
+                    src, read_key = np.ascontiguousarray(source[read_key]), None
+                else:
+                    src = _source_spec(source)
+                pending.add(
+                    pool.submit(
+                        _dff_chunk,
+                        src,
+                        read_key,
+                        str(path),
+                        write_key,
+                        slice(t0 - start, t1 - start),
+                        window,
+                        percentile,
+                        time_axis,
+                    )
+                )
+                if len(pending) >= n_inflight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        f.result()
+        for f in pending:
+            f.result()
+
+    return zarr.open(str(path), mode="r")
+
+
+def _tile_shape(shape, time_axis, n_frames, max_memory):
+    # largest tile of the non time axes, outermost axes cut first, such that
+    # n_frames x tile float32 values fit in max_memory
+    budget = max(1, max_memory // (4 * n_frames))
+    tile = list(shape)
+    others = [a for a in range(len(shape)) if a != time_axis]
+    for i, a in enumerate(others):
+        inner = int(np.prod([shape[b] for b in others[i + 1 :]]))
+        if inner <= budget:
+            tile[a] = max(1, min(shape[a], budget // inner))
+            break
+        tile[a] = 1
+    return tile
+
+
+def _take(arr, sl, axis):
+    key = [slice(None)] * arr.ndim
+    key[axis] = sl
+    return arr[tuple(key)]
+
+
+def _source_spec(source):
+    # h5py datasets cannot be pickled, the workers reopen the file
+    if hasattr(source, "file") and hasattr(source.file, "filename"):
+        return ("h5", source.file.filename, source.name)
+    return ("array", source)
+
+
+def _dff_chunk(src, read_key, path, write_key, crop, window, percentile, time_axis):
+    import zarr
+
+    if isinstance(src, np.ndarray):
+        f = src
+    elif src[0] == "h5":
+        import h5py
+
+        with h5py.File(src[1], "r") as file:
+            f = file[src[2]][read_key]
+    else:
+        f = src[1][read_key]
+
+    dff = delta_f_over_f(f, window, percentile, time_axis)
+    out = zarr.open(path, mode="r+")
+    out[write_key] = _take(dff, crop, time_axis)
@@ -0,0 +1,99 @@
+import numpy as np
+from scipy import sparse
+
+from .colormaps import map_color
+
+
+def region_assignment(labels, n_regions=None, normalize=True):
+    """Sparse assignment matrix of neurons to regions.
+
+    Parameters
+    ==========
+    labels : np.ndarray
+        (n_neurons,) int region of each neuron, negative for unlabeled neurons.
+    n_regions : int
+        number of regions, defaults to `labels.max() + 1`.
+    normalize : bool
+        divide each row by the size of the region, so that the product with
+        a neuron vector gives region means.
+
+    Return
+    ======
+    assignment : scipy.sparse.csr_matrix
+        (n_regions, n_neurons) matrix.
+    """
+    labels = np.asarray(labels, dtype=int)
+    if n_regions is None:
+        n_regions = labels.max() + 1
+    neurons = np.flatnonzero(labels >= 0)
+    regions = labels[neurons]
+    weights = np.ones(len(neurons))
+    if normalize:
+        sizes = np.bincount(regions, minlength=n_regions)
+        weights = weights / sizes[regions]
+    return sparse.csr_matrix(
+        (weights, (regions, neurons)), shape=(n_regions, len(labels))
+    )
+
+
+class RegionAggregator:
+    """Aggregate neuron activities and couplings over atlas regions.
+
+    Parameters
+    ==========
+    labels : np.ndarray
+        (n_neurons,) int region of each neuron, negative for unlabeled neurons.
+    n_regions : int
+        number of regions, defaults to `labels.max() + 1`.
+    chunk_size : int
+        number of rows read at once from the inputs, so that h5py or zarr
+        datasets are streamed.
+    """
+
+    def __init__(self, labels, n_regions=None, chunk_size=4096):
+        self.labels = np.asarray(labels, dtype=int)
+        self.assignment = region_assignment(self.labels, n_regions)
+        self.n_regions = self.assignment.shape[0]
+        self.chunk_size = chunk_size
+
+    def activity(self, activity):
+        """(n_regions, time) mean activity, from (time, neurons) activity."""
+        nt = activity.shape[0]
+        out = np.empty((self.n_regions, nt))
+        for t in range(0, nt, self.chunk_size):
+            block = np.asarray(activity[t : t + self.chunk_size], dtype=float)
+            out[:, t : t + self.chunk_size] = self.assignment @ block.T
+        return out
+
+    def coupling(self, matrix):
+        """(n_regions, n_regions) mean coupling, from a neuron x neuron matrix."""
+        n = matrix.shape[0]
+        assert matrix.shape == (n, n) == (n, self.assignment.shape[1])
+        out = np.zeros((self.n_regions, self.n_regions))
+        columns = self.assignment.tocsc()
+        for s in range(0, n, self.chunk_size):
+            rows = slice(s, s + self.chunk_size)
+            block = np.asarray(matrix[rows], dtype=float)
+            # A M A.T accumulated over row blocks: A[:, rows] @ (M[rows] @ A.T)
+            out += columns[:, rows] @ (self.assignment @ block.T).T
+        return out
+
+    def aggregate(self, activity=None, matrix=None):
+        """Compute region activities and couplings, each in a single pass."""
+        activity = None if activity is None else self.activity(activity)
+        matrix = None if matrix is None else self.coupling(matrix)
+        return activity, matrix
+
+    def to_neurons(self, region_values, fill=np.nan):
+        """Broadcast region values back to neurons, `fill` for unlabeled ones."""
+        values = np.full(len(self.labels), fill, dtype=float)
+        labeled = self.labels >= 0
+        values[labeled] = np.asarray(region_values)[self.labels[labeled]]
+        return values
+
+    def show(self, layer, region_values, cmap, crange):
+        """Color a points layer of neurons by region values."""
+        values = self.to_neurons(region_values)
+        colors = map_color(cmap, np.nan_to_num(values), crange)
+        colors[np.isnan(values), 3] = 0
+        layer.face_color = colors
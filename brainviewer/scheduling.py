@@ -0,0 +1,103 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from qtpy.QtCore import QObject, QTimer, Signal
+
+
+class CallbackScheduler(QObject):
+    """Coalesce bursts of GUI events into a single piece of work.
+
+    Every call to `schedule` replaces the pending work, so only the latest
+    event of a burst is processed. The heavy part (`compute`) can run in a
+    worker thread, its result is handed back to `apply` on the GUI thread,
+    unless newer work has been scheduled in the meantime. Outdated work that
+    has not started is cancelled, running work is told through its `cancel`
+    event so that long loops can stop early.
+
+    Parameters
+    ==========
+    delay : int
+        delay in milliseconds.
+    mode : str
+        "debounce" runs the work once events stop for `delay` ms,
+        "throttle" runs it at most once every `delay` ms during a burst.
+    """
+
+    _finished = Signal(int, object, object)
+
+    def __init__(self, delay=50, mode="debounce", parent=None):
+        super().__init__(parent)
+        assert mode in ("debounce", "throttle")
+        self.mode = mode
+        self._pending = None
+        self._generation = 0
+        self._future = None
+        self._cancel = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._run)
+        self._finished.connect(self._apply)
+
+    def schedule(self, compute, apply=None):
+        """Schedule `compute()` then `apply(result)`.
+
+        Without `apply`, `compute()` runs on the GUI thread. With it,
+        `compute(cancel)` runs in a worker thread and `apply` on the GUI
+        thread, `cancel` is a threading.Event set once the work is outdated.
+        """
+        self._pending = (compute, apply)
+        if self.mode == "debounce" or not self._timer.isActive():
+            self._timer.start()
+
+    def cancel(self):
+        """Drop the pending work and the results of running work."""
+        self._timer.stop()
+        self._pending = None
+        self._generation += 1
+        self._cancel_running()
+
+    def _run(self):
+        if self._pending is None:
+            return
+        compute, apply = self._pending
+        self._pending = None
+        self._generation += 1
+        self._cancel_running()
+
+        if apply is None:
+            compute()
+            return
+
+        generation = self._generation
+        cancel = self._cancel = threading.Event()
+
+        def work():
+            result = compute(cancel)
+            if not cancel.is_set():
+                self._finished.emit(generation, result, apply)
+
+        self._future = self._executor.submit(work)
+        self._future.add_done_callback(_report_exception)
+
+    def _cancel_running(self):
+        self._cancel.set()
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def _apply(self, generation, result, apply):
+        # results of outdated work are dropped
+        if generation == self._generation:
+            apply(result)
+
+
+def _report_exception(future):
+    if future.cancelled():
+        return
+    e = future.exception()
+    if e is not None:
+        traceback.print_exception(type(e), e, e.__traceback__)
@@ -2,12 +2,14 @@ from nis import match
 
 import napari
 import numpy as np
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QComboBox
 from dask.array import shape
 from napari.utils.notifications import show_info
+from scipy import sparse
 from skimage.data import brain
 
 from .colormaps import map_color
+from .scheduling import CallbackScheduler
 
 
 def enable_selection(
@@ -38,6 +40,27 @@ def region_pairing(pairing_matrix, region):
     return (pairing_matrix[:,region]).sum(axis=1) / region.size
 
 
+def region_pairings(pairing_matrix, regions):
+    """
+    Pairing maps of several regions at once, as a single product of the selected columns
+    of the pairing matrix with a sparse selection-indicator matrix normalized by the region
+    sizes. Only the union of the selected columns is read from the matrix.
+    Column j equals region_pairing(pairing_matrix, regions[j]), or 0 for empty regions.
+    """
+    n = pairing_matrix.shape[0]
+    sizes = np.array([len(region) for region in regions], dtype=int)
+    rows = np.concatenate([np.asarray(region, dtype=int) for region in regions] + [np.zeros(0, dtype=int)])
+    if rows.size == 0:
+        return np.zeros((n, len(regions)))
+    # sorted unique columns, as required by h5py fancy indexing
+    selected, rows = np.unique(rows, return_inverse=True)
+    columns = np.repeat(np.arange(len(regions)), sizes)
+    weights = 1 / sizes[columns]
+    indicator = sparse.csc_matrix((weights, (rows, columns)), shape=(len(selected), len(regions)))
+    sub_matrix = np.asarray(pairing_matrix[:, selected], dtype=float)
+    return np.asarray((indicator.T @ sub_matrix.T).T)
+
+
 def is_in_polygon(point, vertices):
     point = np.array(point)
     vertices = np.array(vertices)
@@ -79,7 +102,10 @@ class SelectionTab(QWidget):
         self._cmap = cmap
         self._crange = crange
         self._shape_layers = []
-        self._selection_layer = SelectionLayer(brain_viewer, points_layer, matrix, cmap, crange)
+        self._selection_layers = []
+        self._pairings = None  # cached (n_neurons x n_selections) pairing maps
+        # shape events fire continuously while drawing or dragging a rectangle
+        self._scheduler = CallbackScheduler(delay=100, mode="debounce", parent=self)
 
         self.setLayout(QVBoxLayout())
 
@@ -87,8 +113,14 @@ class SelectionTab(QWidget):
         new_selection_button.clicked.connect(self.add_selection_layer)
         self.layout().addWidget(new_selection_button)
 
+        # pairing map displayed on the points layer
+        self._map_choice = QComboBox()
+        self._map_choice.currentIndexChanged.connect(self.show_pairing)
+        self.layout().addWidget(self._map_choice)
+
 
     def add_selection_layer(self):
+        name = f"Selection {len(self._shape_layers) + 1}: {self._points_layer.name}"
         shape_layer = self._brain_viewer.viewer.add_shapes(
             data=None,
             shape_type='rectangle',
@@ -96,18 +128,51 @@ class SelectionTab(QWidget):
             edge_color='red',
             face_color='#ffffff3f',
             opacity=0.5,
-            name=f"Selection: {self._points_layer.name}",
+            name=name,
         )
         shape_layer.mode = 'add_rectangle'
 
-        def on_shape_change():
-            self._selection_layer.unselect_all()
+        shape_layer.events.data.connect(self.on_shape_change)
+        self._shape_layers.append(shape_layer)
+        self._selection_layers.append(
+            SelectionLayer(self._brain_viewer, self._points_layer, self._matrix, self._cmap, self._crange)
+        )
+        self._map_choice.addItem(name)
+        self._map_choice.setCurrentIndex(self._map_choice.count() - 1)
+
 
-            for rectangle in shape_layer.data:
-                self._selection_layer.select_polygon(rectangle)
+    def on_shape_change(self, event=None):
+        polygons = [[np.array(polygon) for polygon in layer.data] for layer in self._shape_layers]
+        dims = self._brain_viewer.viewer.dims
+        slice_position = None if dims.ndisplay == 3 else dims.point[0]
+
+        def compute(cancel):
+            # all the pairing maps are computed together
+            selections = [
+                layer.polygons_selection(layer_polygons, slice_position)
+                for layer, layer_polygons in zip(self._selection_layers, polygons)
+            ]
+            if cancel.is_set():
+                return None
+            return selections, region_pairings(self._matrix, selections)
+
+        def apply(result):
+            selections, self._pairings = result
+            for layer, selection in zip(self._selection_layers, selections):
+                layer._selection = selection
+            self.show_pairing()
+
+        self._scheduler.schedule(compute, apply)
 
-        shape_layer.events.data.connect(on_shape_change)
-        self._shape_layers.append(shape_layer)
+
+    def show_pairing(self, index=None):
+        """Recolor the points with a cached pairing map, the current one by default."""
+        if index is None or index < 0:
+            index = self._map_choice.currentIndex()
+        if self._pairings is None or not 0 <= index < self._pairings.shape[1]:
+            return
+        selection = self._selection_layers[index]._selection
+        change_point_colors(self._points_layer, selection, self._pairings[:, index], self._cmap, self._crange)
 
 
 class SelectionLayer:
@@ -121,29 +186,57 @@ class SelectionLayer:
         self._crange = crange
         self._selection = []
 
+        # points sorted along the slicing axis, and last slab found
+        self._indexed_data = None
+        self._slab_cache = None
+
 
     @property
     def selection(self):
         return np.array(self._selection)
 
 
-    def points_in_polygon_selection(self, polygon, thickness=1.5):
+    def points_in_polygon_selection(self, polygon, thickness=1.5, slice_position=None):
         points = self._points_layer.data
         selection = []
 
-        if self._brain_viewer.viewer.dims.ndisplay == 3:
-            return selection
-
-        mask_points_in_slice = np.isclose(points[:, 0], self._brain_viewer.viewer.dims.point[0], atol=thickness/2)
-        points = points[:, 1:]
+        if slice_position is None:
+            if self._brain_viewer.viewer.dims.ndisplay == 3:
+                return selection
+            slice_position = self._brain_viewer.viewer.dims.point[0]
 
-        for i, point in enumerate(points):
-            if is_in_polygon(point, polygon) and mask_points_in_slice[i]:
+        for i in self.points_in_slab(slice_position, thickness):
+            if is_in_polygon(points[i, 1:], polygon):
                 selection.append(i)
 
         return selection
 
 
+    def points_in_slab(self, slice_position, thickness=1.5):
+        """
+        Indices (ascending) of the points within thickness/2 of slice_position along the
+        slicing axis, same tolerance as np.isclose. Found by binary search in the points
+        sorted along that axis, and cached until the slice or the thickness changes.
+        """
+        points = self._points_layer.data
+        if self._indexed_data is not points:
+            self._order = np.argsort(points[:, 0], kind="stable")
+            self._sorted_z = points[self._order, 0]
+            self._indexed_data = points
+            self._slab_cache = None
+
+        key = (slice_position, thickness)
+        if self._slab_cache is not None and self._slab_cache[0] == key:
+            return self._slab_cache[1]
+
+        tolerance = thickness/2 + 1e-5 * abs(slice_position)
+        start = np.searchsorted(self._sorted_z, slice_position - tolerance, side="left")
+        stop = np.searchsorted(self._sorted_z, slice_position + tolerance, side="right")
+        slab = np.sort(self._order[start:stop])
+        self._slab_cache = (key, slab)
+        return slab
+
+
     def select_polygon(self, polygon):
         self._selection.extend(self.points_in_polygon_selection(polygon))
         self.update_selection()
@@ -161,6 +254,18 @@ class SelectionLayer:
         self.update_selection()
 
 
+    def polygons_selection(self, polygons, slice_position):
+        """
+        Points in any of the polygons, in the slice at slice_position (None in 3D).
+        Does not access the viewer, so it can run off the GUI thread.
+        """
+        selection = []
+        if slice_position is not None:
+            for polygon in polygons:
+                selection.extend(self.points_in_polygon_selection(polygon, slice_position=slice_position))
+        return selection
+
+
     def update_selection(self):
         values = region_pairing(self._pairing_matrix, self.selection) if self.selection.size > 0 else 0
         change_point_colors(self._points_layer, self._selection, values, self._cmap, self._crange)
\ No newline at end of file
@@ -0,0 +1,251 @@
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# integer codes reserved to store NaN values
+_NAN_CODES = {np.dtype(np.int8): -128, np.dtype(np.uint16): 65535}
+
+
+class CompactArray:
+    """Array stored with a compact dtype, decoded on access.
+
+    Parameters
+    ==========
+    arr : array-like
+        array to compress, can be a numpy array, a h5py or zarr dataset.
+    dtype : str or numpy dtype
+        storage dtype, one of float32, float16, int8 or uint16.
+    chunk_size : int
+        number of rows encoded at once, bounds the temporary memory used.
+
+    Note
+    ====
+    integer dtypes are linearly scaled between the min and max of the array :
+    arr = code * scale + offset
+    the lowest (int8) or highest (uint16) code is reserved for NaNs.
+    float16 can only store values up to 65504, larger values raise a
+    ValueError instead of silently becoming inf.
+    """
+
+    def __init__(self, arr, dtype="float16", chunk_size=1024):
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(arr.shape)
+        assert self.dtype in (
+            np.float32,
+            np.float16,
+            np.int8,
+            np.uint16,
+        ), f"unsupported compact dtype {self.dtype}"
+
+        if self.dtype.kind == "f":
+            self.scale, self.offset = 1.0, 0.0
+        else:
+            vmin, vmax = _nan_min_max(arr, chunk_size)
+            info = np.iinfo(self.dtype)
+            self._lo = info.min + 1 if self.dtype == np.int8 else info.min
+            self._hi = info.max - 1 if self.dtype == np.uint16 else info.max
+            self.scale = (vmax - vmin) / (self._hi - self._lo) if vmax > vmin else 1.0
+            self.offset = vmin - self._lo * self.scale
+
+        self.data = np.empty(self.shape, dtype=self.dtype)
+        for s in range(0, self.shape[0], chunk_size):
+            self.data[s : s + chunk_size] = self._encode(arr[s : s + chunk_size])
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return self._decode(self.data[key])
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[...]
+        return arr if dtype is None else arr.astype(dtype)
+
+    def _encode(self, values):
+        values = np.asarray(values)
+        if self.dtype.kind == "f":
+            finite = values[np.isfinite(values)]
+            vmax = np.finfo(self.dtype).max
+            if finite.size and np.abs(finite).max() > vmax:
+                raise ValueError(f"values exceed the {self.dtype} range (±{vmax})")
+            return values.astype(self.dtype)
+        codes = np.rint((values - self.offset) / self.scale)
+        codes = np.clip(codes, self._lo, self._hi)
+        codes[np.isnan(values)] = _NAN_CODES[self.dtype]
+        return codes.astype(self.dtype)
+
+    def _decode(self, codes):
+        if self.dtype.kind == "f":
+            # a copy, so that callers cannot modify the stored data
+            return np.array(codes, dtype=np.float32)
+        codes = np.asarray(codes)
+        values = codes.astype(np.float32) * np.float32(self.scale)
+        values = values + np.float32(self.offset)
+        # np.where also handles scalar indexing, e.g. arr[i, j]
+        return np.where(codes == _NAN_CODES[self.dtype], np.float32(np.nan), values)
+
+
+class NeuronMajorActivity:
+    """Time-major activity dataset with a neuron-major sidecar copy.
+
+    Single-neuron traces `activity[:, i]` of a (time x neurons) dataset stored
+    on disk touch every chunk of the file. This wrapper transposes the dataset
+    once into a chunked zarr sidecar (neurons x time) so that a trace becomes
+    a single contiguous read. Until the sidecar is ready, reads fall back to
+    the source dataset.
+
+    When the source is chunked along neurons, blocks of neurons aligned on its
+    chunks are transposed. Otherwise (contiguous, or chunks spanning too many
+    neurons for `max_memory`), bands of frames are read and scattered into a
+    sidecar chunked along time with the same band length.
+
+    Parameters
+    ==========
+    source : h5py.Dataset or zarr.Array
+        activity of shape (time, neurons).
+    path : str or Path
+        location of the zarr sidecar, defaults to a directory next to the
+        HDF5 file.
+    chunk_neurons : int
+        number of neurons per chunk of the sidecar.
+    max_memory : int
+        maximum number of bytes read at once during the transposition.
+    background : bool
+        transpose in a background thread.
+    """
+
+    def __init__(
+        self,
+        source,
+        path=None,
+        chunk_neurons=8,
+        max_memory=512 * 2**20,
+        background=True,
+    ):
+        import zarr
+
+        assert source.ndim == 2
+        self.source = source
+        self.shape = tuple(source.shape)
+        self.dtype = source.dtype
+        self.chunk_neurons = chunk_neurons
+        self.max_memory = max_memory
+
+        if path is None:
+            if not hasattr(source, "file"):
+                raise TypeError("path is required for non HDF5 datasets")
+            name = source.name.strip("/").replace("/", "_")
+            h5_path = Path(source.file.filename)
+            path = h5_path.with_name(f"{h5_path.stem}.{name}.T.zarr")
+        self.path = Path(path)
+
+        n_t, n_n = self.shape
+        self._done = threading.Event()
+        self._error = None
+        if self.path.exists():
+            self.sidecar = zarr.open(str(self.path), mode="r")
+            if self.sidecar.attrs.get("complete", False):
+                assert self.sidecar.shape == (n_n, n_t)
+                self._done.set()
+                return
+        self._mode, self._block = self._plan()
+        chunk_t = n_t if self._mode == "columns" else self._block
+        self.sidecar = zarr.open(
+            str(self.path),
+            mode="w",
+            shape=(n_n, n_t),
+            chunks=(chunk_neurons, chunk_t),
+            dtype=self.dtype,
+        )
+
+        if background:
+            self._thread = threading.Thread(target=self._transpose, daemon=True)
+            self._thread.start()
+        else:
+            self._transpose()
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self._error is None
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        if self._error is not None:
+            raise self._error
+        return self.ready
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self.ready and isinstance(key, tuple) and len(key) == 2:
+            t, n = key
+            return self.sidecar[n, t].T
+        return self.source[key]
+
+    def _plan(self):
+        # ("columns", nb of neurons) or ("rows", nb of frames) read at once, both
+        # aligned on chunk boundaries so each chunk is read/written once
+        n_t, n_n = self.shape
+        itemsize = self.dtype.itemsize
+        src_chunks = getattr(self.source, "chunks", None)
+        if src_chunks:
+            width = self.max_memory // (n_t * itemsize)
+            step = int(np.lcm(self.chunk_neurons, src_chunks[1]))
+            if step <= width:
+                return "columns", width // step * step
+        rows = max(1, self.max_memory // (n_n * itemsize))
+        if src_chunks and src_chunks[0] <= rows:
+            rows = rows // src_chunks[0] * src_chunks[0]
+        return "rows", min(rows, n_t)
+
+    def _transpose(self):
+        try:
+            n_t, n_n = self.shape
+            if self._mode == "columns":
+                for s in range(0, n_n, self._block):
+                    block = np.asarray(self.source[:, s : s + self._block])
+                    self.sidecar[s : s + self._block, :] = block.T
+            else:
+                for s in range(0, n_t, self._block):
+                    band = np.asarray(self.source[s : s + self._block, :])
+                    self.sidecar[:, s : s + self._block] = band.T
+            self.sidecar.attrs["complete"] = True
+        except Exception as e:
+            self._error = e
+            raise
+        finally:
+            self._done.set()
+
+
+def compact(arr, dtype=None, chunk_size=1024):
+    """Return `arr` as a CompactArray, or unchanged if `dtype` is None."""
+    if dtype is None or isinstance(arr, CompactArray):
+        return arr
+    return CompactArray(arr, dtype=dtype, chunk_size=chunk_size)
+
+
+def _nan_min_max(arr, chunk_size):
+    vmin, vmax = np.inf, -np.inf
+    for s in range(0, arr.shape[0], chunk_size):
+        block = np.asarray(arr[s : s + chunk_size])
+        if np.all(np.isnan(block)):
+            continue
+        vmin = min(vmin, np.nanmin(block))
+        vmax = max(vmax, np.nanmax(block))
+    if not np.isfinite(vmin):
+        vmin, vmax = 0.0, 0.0
+    return float(vmin), float(vmax)
@@ -1,3 +1,6 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import napari
@@ -6,14 +9,19 @@ import zarr
 from napari.utils.notifications import show_info, show_warning
 from qtpy.QtWidgets import QFileDialog
 
-from .hdf5_handling import HDF5_Browser
+from .export import render_movie
+from .hdf5_handling import HDF5_Browser, read_fish
+from .lod import PointLevelOfDetail
 from .selection import SelectionTab
 
 
 class NapariBrainViewer:
-    def __init__(self, work_dir=None, space_unit="μm", time_unit="sec"):
+    def __init__(self, work_dir=None, space_unit="μm", time_unit="sec", show=True):
         self._selection_dock = None
-        self._viewer = napari.Viewer()
+        if not show and "DISPLAY" not in os.environ:
+            # headless render node, must be set before Qt is started
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        self._viewer = napari.Viewer(show=show)
         self.work_dir = work_dir
         self.space_unit = space_unit
         self.time_unit = time_unit
@@ -76,6 +84,8 @@ class NapariBrainViewer:
         cmap="inferno",
         crange=None,
         size=None,
+        lod=None,
+        lod_ranks=None,
         **kwargs,
     ):
         assert isinstance(coords, np.ndarray)
@@ -112,6 +122,14 @@ class NapariBrainViewer:
                 **kwargs,
             )
 
+        # level-of-detail display, lod is the maximum number of points shown
+        # and lod_ranks optional precomputed `stratified_ranks` of coords
+        if lod:
+            max_points = 50_000 if lod is True else lod
+            layer.lod = PointLevelOfDetail(
+                self._viewer, layer, max_points, ranks=lod_ranks
+            )
+
         return layer
 
     def contours(self, contours, **kwargs):
@@ -164,16 +182,17 @@ class NapariBrainViewer:
         )
         return layer
 
-    def hyperstack(self, hstack_arr, cmap="inferno", **kwargs):
+    def hyperstack(self, hstack_arr, cmap="inferno", clims=None, **kwargs):
         assert isinstance(hstack_arr, (np.ndarray, zarr.core.Array))
         assert hstack_arr.ndim == 4
-        contrast_limits = np.quantile(
-            hstack_arr[hstack_arr.shape[0] // 2, hstack_arr.shape[1] // 2, :, :],
-            [0.5, 0.9999],
-        )
+        if clims is None:
+            clims = np.quantile(
+                hstack_arr[hstack_arr.shape[0] // 2, hstack_arr.shape[1] // 2, :, :],
+                [0.5, 0.9999],
+            )
         layer = self._viewer.add_image(
             hstack_arr,
-            contrast_limits=contrast_limits,
+            contrast_limits=clims,
             multiscale=False,
             colormap=cmap,
             **kwargs,
@@ -210,6 +229,107 @@ class NapariBrainViewer:
 
         self._h5widget = self._viewer.window.add_dock_widget(HDF5_Browser(self))
 
+    def load_cohort(
+        self,
+        paths,
+        coords="Data/Brain/coords",
+        values=None,
+        activity=None,
+        lod=None,
+        max_workers=4,
+        **kwargs,
+    ):
+        """Load a cohort of fish, one points layer per HDF5 file.
+
+        Files are read concurrently in worker processes, at most `max_workers`
+        at a time so that memory stays bounded. Level-of-detail ranks and the
+        contrast limits shared by all fish are computed in the same pass.
+
+        Parameters
+        ==========
+        paths : list of str or Path
+            HDF5 files, one per fish.
+        coords : str
+            path of the neuron coordinates dataset in each file.
+        values : str
+            path of an optional per-neuron values dataset, used for colors.
+        activity : str
+            path of an optional (time, neurons) activity dataset, left on disk
+            and stored in `layer.metadata["activity"]`.
+        lod : bool or int
+            level-of-detail display, see `points`.
+        max_workers : int
+            number of files read concurrently.
+
+        Return
+        ======
+        layers : list of napari.layers.Points
+            in the order of `paths`.
+        """
+        import h5py
+
+        paths = [Path(p) for p in paths]
+        lod_levels = 8 if lod else None
+        # forking a process with running Qt/worker threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+            fishes = list(
+                pool.map(
+                    read_fish,
+                    paths,
+                    [coords] * len(paths),
+                    [values] * len(paths),
+                    [lod_levels] * len(paths),
+                )
+            )
+
+        crange = None
+        if values is not None:
+            cranges = np.array([fish["crange"] for fish in fishes])
+            crange = (np.nanmin(cranges[:, 0]), np.nanmax(cranges[:, 1]))
+
+        layers = []
+        for path, fish in zip(paths, fishes):
+            layer = self.points(
+                fish["coords"],
+                fish["values"],
+                crange=crange,
+                lod=lod,
+                lod_ranks=fish["ranks"],
+                name=path.stem,
+                **kwargs,
+            )
+            if activity is not None:
+                layer.metadata["activity"] = h5py.File(path, "r")[activity]
+            layers.append(layer)
+        return layers
+
+    def export_movie(
+        self,
+        path,
+        frames,
+        activities=None,
+        camera_path=None,
+        time_axis=None,
+        fps=10,
+        max_workers=4,
+    ):
+        """Render time frames of the displayed layers to a video or images.
+
+        See `brainviewer.export.render_movie` for the parameters. Use
+        `NapariBrainViewer(show=False)` to render without a display.
+        """
+        return render_movie(
+            self._viewer,
+            path,
+            frames,
+            activities=activities,
+            camera_path=camera_path,
+            time_axis=time_axis,
+            fps=fps,
+            max_workers=max_workers,
+        )
+
     def select_rect_ROI(self, width=150, height=150):
         from qtpy.QtWidgets import QPushButton
 